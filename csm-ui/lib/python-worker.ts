@@ -0,0 +1,115 @@
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import readline from 'readline';
+import path from 'path';
+import os from 'os';
+import { v4 as uuidv4 } from 'uuid';
+
+// A long-lived Python process that keeps its model loaded between requests.
+// Requests and responses are exchanged as JSON lines over stdin/stdout and
+// matched up by id; anything the script logs goes to stderr.
+export type WorkerResponse = { id?: string; [key: string]: unknown };
+
+type PendingRequest = {
+  resolve: (response: WorkerResponse) => void;
+  reject: (error: Error) => void;
+};
+
+class PythonWorker {
+  private process: ChildProcessWithoutNullStreams;
+  private pending = new Map<string, PendingRequest>();
+  private stderrTail = '';
+  exited = false;
+
+  constructor(interpreter: string, args: string[], cwd: string) {
+    console.log('Starting Python worker:', interpreter, args.join(' '));
+    this.process = spawn(interpreter, args, { cwd });
+
+    const lines = readline.createInterface({ input: this.process.stdout });
+    lines.on('line', (line) => {
+      let response: WorkerResponse;
+      try {
+        response = JSON.parse(line);
+      } catch {
+        console.log(`Worker output: ${line}`);
+        return;
+      }
+      const request = response.id ? this.pending.get(response.id) : undefined;
+      if (request && response.id) {
+        this.pending.delete(response.id);
+        request.resolve(response);
+      }
+    });
+
+    this.process.stderr.on('data', (data: Buffer) => {
+      const text = data.toString();
+      process.stderr.write(text);
+      // Keep the last few KB around so failures can be reported to the client
+      this.stderrTail = (this.stderrTail + text).slice(-4096);
+    });
+
+    this.process.on('exit', (code) => {
+      this.fail(new Error(`Python worker exited with code ${code}: ${this.stderrTail}`));
+    });
+
+    this.process.on('error', (error) => this.fail(error));
+
+    // Writing to a worker that failed to start or has died raises EPIPE /
+    // ERR_STREAM_DESTROYED on stdin; unhandled, that would crash the server
+    this.process.stdin.on('error', (error) => this.fail(error));
+  }
+
+  // Mark the worker dead so the next request spawns a new one, and fail
+  // everything still waiting on this one
+  private fail(error: Error) {
+    this.exited = true;
+    this.pending.forEach((request) => request.reject(error));
+    this.pending.clear();
+  }
+
+  request(payload: Record<string, unknown>): Promise<WorkerResponse> {
+    const id = uuidv4();
+    return new Promise((resolve, reject) => {
+      if (this.exited) {
+        reject(new Error(`Python worker is not running: ${this.stderrTail}`));
+        return;
+      }
+      this.pending.set(id, { resolve, reject });
+      this.process.stdin.write(JSON.stringify({ ...payload, id }) + '\n');
+    });
+  }
+
+  get stderr() {
+    return this.stderrTail;
+  }
+}
+
+// Keep workers on globalThis so they survive module reloads in development
+const globalForWorkers = globalThis as unknown as { pythonWorkers?: Map<string, PythonWorker> };
+const workers = globalForWorkers.pythonWorkers ?? new Map<string, PythonWorker>();
+globalForWorkers.pythonWorkers = workers;
+
+// Use the Python interpreter from the virtual environment
+// This is critical for production mode where the environment might not be activated
+// The path is different depending on the OS
+export function getPythonInterpreter(projectRoot: string) {
+  const isWindows = os.platform() === 'win32';
+  return path.join(
+    projectRoot,
+    '..',
+    '.venv',
+    isWindows ? 'Scripts' : 'bin',
+    isWindows ? 'python.exe' : 'python'
+  );
+}
+
+// Return the running worker for a script, spawning it on first use or after it exits
+export function getPythonWorker(projectRoot: string, script: string, args: string[] = []) {
+  const key = [script, ...args].join(' ');
+  let worker = workers.get(key);
+  if (!worker || worker.exited) {
+    const scriptPath = path.join(projectRoot, '..', script);
+    worker = new PythonWorker(getPythonInterpreter(projectRoot), [scriptPath, '--server', ...args], projectRoot);
+    workers.set(key, worker);
+  }
+  return worker;
+}
@@ -1,11 +1,10 @@
 import { NextApiRequest, NextApiResponse } from 'next';
-import { exec } from 'child_process';
 import path from 'path';
 import fs from 'fs';
 import { v4 as uuidv4 } from 'uuid';
-import os from 'os';
+import { getPythonWorker, WorkerResponse } from '@/lib/python-worker';
 
-// This function will call our Python script to generate audio
+// This function will send the request to our Python generation worker
 export default async function handler(
   req: NextApiRequest,
   res: NextApiResponse
@@ -55,123 +54,102 @@ export default async function handler(
       fs.mkdirSync(audioDir, { recursive: true });
     }
 
-    // Get the absolute path to the Python script
-    // In production, we need to ensure we're pointing to the correct location
-    const pythonScriptPath = path.join(projectRoot, '..', 'generate_speech.py');
-    
-    // Use the Python interpreter from the virtual environment
-    // This is critical for production mode where the environment might not be activated
-    // The path is different depending on the OS
-    const isWindows = os.platform() === 'win32';
-    const pythonInterpreter = path.join(
-      projectRoot,
-      '..',
-      '.venv',
-      isWindows ? 'Scripts' : 'bin',
-      isWindows ? 'python.exe' : 'python'
-    );
-    
     console.log('Environment:', process.env.NODE_ENV);
     console.log('Project root:', projectRoot);
-    console.log('Python script path:', pythonScriptPath);
-    console.log('Python interpreter:', pythonInterpreter);
     console.log('Output file path:', outputFile);
     
-    // Use the Python interpreter from the virtual environment instead of system Python
-    let cmd = `"${pythonInterpreter}" "${pythonScriptPath}" --text "${text.replace(/"/g, '\\"')}" --speaker ${speaker} --output "${outputFile}"`;
+    // Send the request to the long-running generation worker, which keeps the
+    // model loaded (and compiled on CUDA) between requests
+    const worker = getPythonWorker(projectRoot, 'generate_speech.py', ['--compile']);
+    const request: Record<string, unknown> = { text, speaker, output: outputFile };
     
     if (contextFile) {
-      cmd += ` --context "${contextFile}"`;
+      request.context = contextFile;
     }
     
     // Only add max_audio_length if it's explicitly required
     // This allows CSM to determine natural speech length
     if (maxAudioLength) {
       // Rename the parameter to make it clearer that it's a maximum limit, not a target length
-      cmd += ` --max_audio_length ${maxAudioLength}`;
+      request.max_audio_length = maxAudioLength;
     }
     
     if (temperature) {
-      cmd += ` --temperature ${temperature}`;
+      request.temperature = temperature;
     }
     
     if (topK) {
-      cmd += ` --topk ${topK}`;
+      request.topk = topK;
     }
 
-    console.log('Executing command:', cmd);
+    console.log('Sending generation request:', request);
 
-    // Execute the Python script
-    exec(cmd, (error, stdout, stderr) => {
+    let response: WorkerResponse;
+    try {
+      response = await worker.request(request);
+    } catch (error) {
+      console.error(`Worker error: ${error}`);
+      return res.status(500).json({ error: 'Failed to generate audio', details: worker.stderr });
+    } finally {
       // Clean up the temporary context file if it exists
       if (contextFile && fs.existsSync(contextFile)) {
         fs.unlinkSync(contextFile);
       }
+    }
 
-      if (error) {
-        console.error(`Execution error: ${error}`);
-        console.error(`Stderr: ${stderr}`);
-        console.error(`Stdout: ${stdout}`);
-        
-        // Check if we still have a valid audio file despite the error
-        // This can happen with the 'NoneType' object has no attribute 'cadam32bit_grad_fp32' warning
-        if (fs.existsSync(outputFile)) {
-          const stats = fs.statSync(outputFile);
-          if (stats.size > 0) {
-            console.log(`Warning occurred but audio was generated successfully: ${outputFile} (${stats.size} bytes)`);
-            
-            // Return the URL to the generated audio file even though there was a warning
-            return res.status(200).json({ 
-              audioUrl: `/audio/${audioId}.wav`,
-              sampleRate: 24000, // CSM's sample rate
-              warnings: stderr || "Warning encountered but audio generated successfully"
-            });
-          }
-        }
-        
-        return res.status(500).json({ error: 'Failed to generate audio', details: stderr });
-      }
-
-      console.log(`Command output: ${stdout}`);
-      
-      // Check if the output file was created
-      if (!fs.existsSync(outputFile)) {
-        console.error(`Output file not created: ${outputFile}`);
-        return res.status(500).json({ error: 'Output file was not created' });
-      }
-      
-      // Get file size to make sure it's not empty
-      const stats = fs.statSync(outputFile);
-      if (stats.size === 0) {
-        console.error(`Output file is empty: ${outputFile}`);
-        return res.status(500).json({ error: 'Generated audio file is empty' });
-      }
-      
-      console.log(`Audio file created successfully: ${outputFile} (${stats.size} bytes)`);
-      
-      // Check for warnings in output
-      const warnings = stdout.includes("Warning:") || stderr ? (stderr || stdout) : null;
+    if (!response.ok) {
+      console.error(`Generation error: ${response.error}`);
       
-      // Log important information to help diagnose production issues
-      console.log(`Returning audio URL: /audio/${audioId}.wav (${stats.size} bytes)`);
-      if (warnings) {
-        console.log(`With warnings: ${warnings.substring(0, 100)}...`);
+      // Check if we still have a valid audio file despite the error
+      // This can happen with the 'NoneType' object has no attribute 'cadam32bit_grad_fp32' warning
+      if (fs.existsSync(outputFile)) {
+        const stats = fs.statSync(outputFile);
+        if (stats.size > 0) {
+          console.log(`Warning occurred but audio was generated successfully: ${outputFile} (${stats.size} bytes)`);
+          
+          // Return the URL to the generated audio file even though there was a warning
+          return res.status(200).json({ 
+            audioUrl: `/audio/${audioId}.wav`,
+            sampleRate: 24000, // CSM's sample rate
+            warnings: response.error || "Warning encountered but audio generated successfully"
+          });
+        }
       }
       
-      // Set Cache-Control headers to prevent caching issues in production
-      res.setHeader('Cache-Control', 'no-store, no-cache, must-revalidate, proxy-revalidate');
-      res.setHeader('Pragma', 'no-cache');
-      res.setHeader('Expires', '0');
-      res.setHeader('Surrogate-Control', 'no-store');
-      
-      // Return the URL to the generated audio file
-      return res.status(200).json({ 
-        audioUrl: `/audio/${audioId}.wav`,
-        sampleRate: 24000, // CSM's sample rate
-        warnings: warnings,
-        fileSize: stats.size, // Include file size for debugging
-        timestamp: Date.now() // Add timestamp to help with caching issues
-      });
+      return res.status(500).json({ error: 'Failed to generate audio', details: response.error });
+    }
+    
+    // Check if the output file was created
+    if (!fs.existsSync(outputFile)) {
+      console.error(`Output file not created: ${outputFile}`);
+      return res.status(500).json({ error: 'Output file was not created' });
+    }
+    
+    // Get file size to make sure it's not empty
+    const stats = fs.statSync(outputFile);
+    if (stats.size === 0) {
+      console.error(`Output file is empty: ${outputFile}`);
+      return res.status(500).json({ error: 'Generated audio file is empty' });
+    }
+    
+    console.log(`Audio file created successfully: ${outputFile} (${stats.size} bytes)`);
+    
+    // Log important information to help diagnose production issues
+    console.log(`Returning audio URL: /audio/${audioId}.wav (${stats.size} bytes)`);
+    
+    // Set Cache-Control headers to prevent caching issues in production
+    res.setHeader('Cache-Control', 'no-store, no-cache, must-revalidate, proxy-revalidate');
+    res.setHeader('Pragma', 'no-cache');
+    res.setHeader('Expires', '0');
+    res.setHeader('Surrogate-Control', 'no-store');
+    
+    // Return the URL to the generated audio file
+    return res.status(200).json({ 
+      audioUrl: `/audio/${audioId}.wav`,
+      sampleRate: 24000, // CSM's sample rate
+      warnings: null,
+      fileSize: stats.size, // Include file size for debugging
+      timestamp: Date.now() // Add timestamp to help with caching issues
     });
   } catch (error) {
     console.error('Error generating speech:', error);
@@ -1,10 +1,9 @@
 import { NextApiRequest, NextApiResponse } from 'next';
-import { exec } from 'child_process';
 import path from 'path';
 import fs from 'fs';
 import { v4 as uuidv4 } from 'uuid';
 import formidable from 'formidable';
-import os from 'os';
+import { getPythonWorker, WorkerResponse } from '@/lib/python-worker';
 
 // Disable body parsing to handle form-data with files
 export const config = {
@@ -64,56 +63,33 @@ export default async function handler(
     const data = fs.readFileSync(audioFile.filepath);
     fs.writeFileSync(tempFilePath, data);
 
-    // Create a Python script to transcribe the audio
-    const transcribeScript = path.join(projectRoot, '..', 'transcribe_audio.py');
+    // Send the file to the long-running transcription worker, which keeps the
+    // Whisper model loaded between requests
+    const worker = getPythonWorker(projectRoot, 'transcribe_audio.py');
+    console.log('Transcribing:', tempFilePath);
     
-    // Use the Python interpreter from the virtual environment
-    // This is critical for production mode where the environment might not be activated
-    // The path is different depending on the OS
-    const isWindows = os.platform() === 'win32';
-    const pythonInterpreter = path.join(
-      projectRoot,
-      '..',
-      '.venv',
-      isWindows ? 'Scripts' : 'bin',
-      isWindows ? 'python.exe' : 'python'
-    );
-    
-    console.log('Transcribe script path:', transcribeScript);
-    console.log('Python interpreter:', pythonInterpreter);
-    
-    // Construct the command using the venv Python interpreter
-    const cmd = `"${pythonInterpreter}" "${transcribeScript}" --audio "${tempFilePath}"`;
-    console.log('Executing command:', cmd);
-    
-    // Execute the Python script
-    exec(cmd, (error, stdout, stderr) => {
+    let result: WorkerResponse;
+    try {
+      result = await worker.request({ audio: tempFilePath });
+    } catch (error) {
+      console.error(`Worker error: ${error}`);
+      return res.status(500).json({ error: 'Failed to transcribe audio', details: worker.stderr });
+    } finally {
       // Clean up the temporary audio file
       if (fs.existsSync(tempFilePath)) {
         fs.unlinkSync(tempFilePath);
       }
+    }
 
-      if (error) {
-        console.error(`Execution error: ${error}`);
-        console.error(`Stderr: ${stderr}`);
-        console.error(`Stdout: ${stdout}`);
-        return res.status(500).json({ error: 'Failed to transcribe audio', details: stderr });
-      }
-
-      console.log(`Command output: ${stdout}`);
+    // Strip the request id before returning the transcription
+    const transcription = { ...result };
+    delete transcription.id;
+    if (transcription.error) {
+      console.error(`Transcription error: ${transcription.error}`);
+      return res.status(500).json({ error: 'Failed to transcribe audio', details: transcription.error });
+    }
 
-      // Parse the output to get the transcription
-      try {
-        const result = JSON.parse(stdout);
-        return res.status(200).json(result);
-      } catch (parseError) {
-        return res.status(500).json({ 
-          error: 'Failed to parse transcription result', 
-          details: stdout,
-          parseError: parseError instanceof Error ? parseError.message : 'Unknown parsing error'
-        });
-      }
-    });
+    return res.status(200).json(transcription);
   } catch (error) {
     console.error('Error transcribing audio:', error);
     return res.status(500).json({ error: 'Internal server error' });
@@ -1,24 +1,488 @@
 import argparse
+import base64
+import hashlib
 import json
+import logging
 import os
 import sys
+import threading
+
+# Must be set before torch initialises CUDA. Expandable segments stop the caching
+# allocator from fragmenting as request lengths vary in the long-running server.
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+
+import numpy as np
+import soundfile as sf
 import torch
 import torchaudio
-import traceback
-from huggingface_hub import hf_hub_download
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from huggingface_hub import hf_hub_download, try_to_load_from_cache
 from generator import load_csm_1b, Segment
 
-def main():
+log = logging.getLogger("csm")
+
+# Granularity, in samples, in which the pinned host buffer for saving audio grows
+PINNED_BUFFER_STEP = 1 << 16
+
+# Pinned host buffer that generated audio is copied into from the GPU before saving,
+# grown on demand and reused across requests
+_pinned_buffer = None
+
+# Resample modules keyed by (orig_freq, new_freq, device); building the sinc kernel
+# is the expensive part, so it is done once per rate pair and reused
+_resamplers = {}
+
+def resample(audio, orig_freq, new_freq):
+    key = (orig_freq, new_freq, audio.device)
+    resampler = _resamplers.get(key)
+    if resampler is None:
+        resampler = torchaudio.transforms.Resample(orig_freq, new_freq, lowpass_filter_width=6).to(audio.device)
+        _resamplers[key] = resampler
+    return resampler(audio.unsqueeze(0)).squeeze(0)
+
+# Threads used to load context clips in parallel
+CONTEXT_LOAD_WORKERS = 8
+
+@dataclass
+class ContextSegment(Segment):
+    # Identity of the audio's source (file path and mtime, or a digest of the inline
+    # samples taken while they are still on the host), used as the context cache key
+    source: bytes = b""
+
+def source_digest(*parts):
+    """Digest identifying where a context clip came from."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else json.dumps(part).encode())
+    return digest.digest()
+
+# Tokenized contexts keyed by the text, speaker and source of their segments. Consecutive
+# requests usually reuse the same reference voice, so the Mimi encoder pass over it is
+# done only once.
+CONTEXT_CACHE_SIZE = 8
+_context_cache = OrderedDict()
+
+def encode_context(generator, context):
+    """Return ``generator.tokenize_context(context)``, memoised in a small LRU.
+
+    Only contexts made entirely of ``ContextSegment``s are cached; the key is built from
+    their sources, so the audio never has to be copied back from the device to hash it.
+    """
+    if not all(getattr(segment, 'source', None) for segment in context):
+        return generator.tokenize_context(context)
+    
+    digest = hashlib.blake2b()
+    for segment in context:
+        digest.update(json.dumps([segment.speaker, segment.text]).encode())
+        digest.update(segment.source)
+    key = digest.digest()
+    
+    if key in _context_cache:
+        _context_cache.move_to_end(key)
+        log.debug("Using cached context encoding")
+        return _context_cache[key]
+    
+    encoded = generator.tokenize_context(context)
+    _context_cache[key] = encoded
+    if len(_context_cache) > CONTEXT_CACHE_SIZE:
+        _context_cache.popitem(last=False)
+    return encoded
+
+def cpu_threads_arg(value):
+    """Parse ``--cpu_threads`` / ``$CSM_CPU_THREADS`` as a positive integer."""
+    try:
+        threads = int(value)
+    except ValueError:
+        threads = 0
+    if threads < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer number of threads, got {value!r}")
+    return threads
+
+def configure_cpu_threads(cpu_threads=None):
+    """Set PyTorch's CPU thread pools for inference.
+
+    Autoregressive decode runs one small step at a time; oversubscribed BLAS/OpenMP
+    threads thrash rather than help. ``None`` keeps PyTorch's intra-op default.
+    """
+    if cpu_threads:
+        torch.set_num_threads(cpu_threads)
+    torch.set_num_interop_threads(1)
+    log.debug("CPU threads: %s", torch.get_num_threads())
+
+def compile_generator(generator, speaker=0):
+    """Compile the backbone and decoder with torch.compile and warm them up.
+
+    The model is driven through ``generate_frame`` rather than ``forward``, so the
+    transformer submodules are compiled individually. A short dummy generation
+    captures the CUDA graphs up front so that cost is not paid by the real request.
+    """
+    model = generator._model
+    for mode in ("reduce-overhead", "default"):
+        log.debug("Compiling generator with torch.compile (mode=%s)...", mode)
+        model.backbone = torch.compile(model.backbone, mode=mode, fullgraph=False)
+        model.decoder = torch.compile(model.decoder, mode=mode, fullgraph=False)
+        try:
+            generator.generate(text=" ", speaker=speaker, context=[], max_audio_length_ms=200)
+            log.debug("Generator compiled and warmed up")
+            return generator
+        except Exception as e:
+            log.warning("torch.compile (mode=%s) failed: %s", mode, e)
+            model.backbone = model.backbone._orig_mod
+            model.decoder = model.decoder._orig_mod
+    log.debug("Falling back to eager mode")
+    return generator
+
+def resolve_model_path(model_path=None):
+    """Return the checkpoint path, downloading it from Hugging Face if needed.
+
+    Lookup order: explicit path, Hugging Face cache (honours ``HF_HUB_CACHE`` /
+    ``HUGGINGFACE_HUB_CACHE``), ``ckpt.pt`` in the current or parent directory.
+    """
+    if model_path and os.path.exists(model_path):
+        # Use explicit model path if provided and exists
+        log.debug("Using provided model path: %s", model_path)
+        return model_path
+    
+    # Resolves the cached snapshot for the current revision in one lookup;
+    # returns a non-str sentinel when the file is known to be missing
+    cached_path = try_to_load_from_cache(repo_id="sesame/csm-1b", filename="ckpt.pt")
+    if isinstance(cached_path, str):
+        log.debug("Found cached model at: %s", cached_path)
+        return cached_path
+    
+    for path in ["ckpt.pt", os.path.join(os.path.dirname(os.getcwd()), "ckpt.pt")]:
+        if os.path.exists(path):
+            log.debug("Found local model at: %s", path)
+            return os.path.abspath(path)
+    
+    # Download model if not found locally
+    log.debug("Downloading model from Hugging Face...")
+    try:
+        model_path = hf_hub_download(repo_id="sesame/csm-1b", filename="ckpt.pt")
+        log.debug("Model downloaded to: %s", model_path)
+    except Exception as e:
+        log.error("Error downloading model: %s", e)
+        raise
+    return model_path
+
+def init_generator(model_path=None, device="cuda", compile=False):
+    """Locate the checkpoint and load the generator once."""
+    # The backbone and decoder already run in bfloat16 (see load_csm_1b); let the
+    # FP32 work that remains (Mimi codec, watermarker) use TF32 tensor cores
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    
+    log.debug("Loading model...")
+    model_path = resolve_model_path(model_path)
+    
+    # Initialize generator
+    log.debug("Initializing generator on %s...", device)
+    try:
+        # Explicitly pass the model path
+        generator = load_csm_1b(ckpt_path=model_path, device=device)
+        log.debug("Generator initialized")
+    except Exception as e:
+        log.exception("Error initializing generator: %s", e)
+        raise
+    
+    if compile and device == "cuda":
+        compile_generator(generator)
+    
+    return generator
+
+def load_audio_file(audio_path, sample_rate, device, encoded_path=None):
+    """Load a mono clip resampled to ``sample_rate`` on ``device``.
+
+    The resampled clip is cached as a ``.pt`` tensor next to the source file (or at
+    ``encoded_path``) and reused while it is newer than the source.
+    """
+    cache_path = encoded_path or f"{audio_path}.{sample_rate}.pt"
+    try:
+        use_cache = os.path.getmtime(cache_path) >= os.path.getmtime(audio_path)
+    except OSError:
+        use_cache = False
+    if use_cache:
+        try:
+            audio_tensor = torch.load(cache_path, map_location="cpu", mmap=True, weights_only=True)
+            log.debug("Loaded resampled audio from cache: %s", cache_path)
+            return audio_tensor.to(device)
+        except Exception as e:
+            # Unreadable (e.g. truncated by an older writer); decode again and rewrite it
+            log.warning("Ignoring unreadable audio cache %s: %s", cache_path, e)
+    
+    # Read through libsndfile directly rather than torchaudio's backend
+    # dispatch (which may go through ffmpeg); supports WAV/FLAC/OGG only
+    data, orig_sample_rate = sf.read(audio_path, dtype='float32', always_2d=False)
+    audio_tensor = torch.from_numpy(data)
+    if device.type == "cuda":
+        # Stage through pinned memory so the copy can run asynchronously,
+        # then resample on the GPU
+        audio_tensor = audio_tensor.pin_memory().to(device, non_blocking=True)
+    if audio_tensor.dim() > 1:
+        # Downmix (frames, channels) to mono
+        audio_tensor = audio_tensor.mean(dim=1)
+    audio_tensor = resample(audio_tensor, orig_sample_rate, sample_rate)
+    log.debug("Audio loaded and resampled from %s to %s", orig_sample_rate, sample_rate)
+    
+    # Write to a temporary file in the same directory and rename it into place, so a
+    # concurrent reader (another loader thread or worker process) never sees a partial file
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    # torch.save reports an unopenable or full target as RuntimeError rather than OSError;
+    # either way the cache is only an optimisation and the decoded clip is still returned
+    try:
+        torch.save(audio_tensor.cpu(), tmp_path)
+        os.replace(tmp_path, cache_path)
+    except (OSError, RuntimeError) as e:
+        log.warning("Could not write audio cache %s: %s", cache_path, e)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    
+    return audio_tensor
+
+def load_segment(i, segment, generator, device):
+    """Build the Segment for one context entry, or return None if it has no usable audio."""
+    try:
+        audio_tensor = None
+        # If audio path is provided, load audio from file. The UI also sends URL-style
+        # paths (/audio/<id>.wav) that do not exist on disk; those fall through to the
+        # inline audio below
+        if segment.get('audioPath'):
+            log.debug("Loading audio from path for segment %s: %s", i, segment['audioPath'])
+            try:
+                stat = os.stat(segment['audioPath'])
+                source = source_digest(os.path.abspath(segment['audioPath']), stat.st_mtime_ns, stat.st_size)
+                audio_tensor = load_audio_file(
+                    segment['audioPath'], generator.sample_rate, device, segment.get('encodedPath')
+                )
+            except (FileNotFoundError, sf.LibsndfileError) as e:
+                log.debug("Cannot load audio path for segment %s: %s", i, e)
+        
+        if audio_tensor is None:
+            if segment.get('audio_b64'):
+                # Raw samples as base64 ({"audio_b64", "audio_dtype", "audio_sr"}); decoding
+                # is a single buffer copy instead of boxing every sample as a Python float
+                log.debug("Using provided base64 audio data for segment %s", i)
+                raw = base64.b64decode(segment['audio_b64'])
+                dtype = np.dtype(segment.get('audio_dtype', 'float32'))
+                samples = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+                if dtype.kind == 'i':
+                    # Integer PCM (e.g. int16) is scaled to [-1, 1]
+                    samples /= np.iinfo(dtype).max
+                elif dtype.kind != 'f':
+                    raise ValueError(f"Unsupported audio_dtype {dtype.name!r}, expected a float or signed integer type")
+                source = source_digest(dtype.str, segment.get('audio_sr'), raw)
+                audio_tensor = torch.from_numpy(samples).to(device)
+                audio_tensor = resample(audio_tensor, segment.get('audio_sr', generator.sample_rate), generator.sample_rate)
+            elif 'audio' in segment and segment['audio']:
+                # If audio data is provided directly (as array). Deprecated: JSON float
+                # lists are slow to parse and large; send audio_b64 instead
+                log.debug("Using provided audio data for segment %s (deprecated, use audio_b64)", i)
+                samples = np.asarray(segment['audio'], dtype=np.float32)
+                source = source_digest(samples.tobytes())
+                audio_tensor = torch.from_numpy(samples).to(device)
+            else:
+                # Skip segments without usable audio
+                log.debug("Skipping segment %s - no audio data", i)
+                return None
+        
+        log.debug("Added segment %s to context", i)
+        return ContextSegment(
+            text=segment['text'],
+            speaker=segment['speaker'],
+            audio=audio_tensor,
+            source=source,
+        )
+    except Exception as e:
+        log.exception("Error processing context segment %s: %s", i, e)
+        return None
+
+def load_context(context_path, generator):
+    """Load context segments from a context JSON file, skipping unusable ones."""
+    context = []
+    device = torch.device(generator.device)
+    if context_path:
+        log.debug("Loading context from %s", context_path)
+        try:
+            with open(context_path, 'r') as f:
+                context_data = json.load(f)
+            
+            log.debug("Context data loaded, %s segments found", len(context_data))
+            
+            # Decode the clips concurrently; libsndfile and torch release the GIL while
+            # they work. Order is preserved by map().
+            if context_data:
+                with ThreadPoolExecutor(max_workers=min(CONTEXT_LOAD_WORKERS, len(context_data))) as executor:
+                    segments = executor.map(
+                        lambda args: load_segment(*args, generator, device), enumerate(context_data)
+                    )
+                    context = [segment for segment in segments if segment is not None]
+            
+            log.debug("Final context contains %s segments", len(context))
+        except Exception as e:
+            log.exception("Error loading context: %s", e)
+            context = []
+    else:
+        log.debug("No context provided")
+    
+    return context
+
+def prepare_output_dir(output):
+    # Create the output directory; a write problem surfaces when the file is saved
+    output_dir = os.path.dirname(output)
+    log.debug("Output directory: %s", output_dir)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+def copy_to_pinned(audio):
+    """Copy a 1-D float32 CUDA tensor into a reused pinned host buffer.
+
+    The returned tensor is a view of the buffer and is only valid until the next call.
+    """
+    global _pinned_buffer
+    n = audio.numel()
+    if _pinned_buffer is None or _pinned_buffer.numel() < n:
+        # Round up so slightly longer utterances don't reallocate every time
+        size = (n // PINNED_BUFFER_STEP + 1) * PINNED_BUFFER_STEP
+        _pinned_buffer = torch.empty(size, dtype=torch.float32, pin_memory=True)
+    host = _pinned_buffer[:n]
+    host.copy_(audio, non_blocking=True)
+    torch.cuda.current_stream(audio.device).synchronize()
+    return host
+
+def save_audio(audio, output, sample_rate):
+    # Check the generated audio
+    log.debug("Audio generated: shape=%s, dtype=%s", audio.shape, audio.dtype)
+    if audio.numel() == 0:
+        log.warning("Generated audio is empty!")
+    
+    # Log audio stats to verify it's not empty; only computed when debug logging is
+    # on, with a single device sync for all three
+    if log.isEnabledFor(logging.DEBUG) and audio.numel() > 0:
+        lo, hi = torch.aminmax(audio)
+        lo, hi, mean = torch.stack([lo, hi, audio.mean()]).tolist()
+        log.debug("Audio min value: %s", lo)
+        log.debug("Audio max value: %s", hi)
+        log.debug("Audio mean value: %s", mean)
+    
+    # Save audio
+    log.debug("Saving audio to %s...", output)
+    # The watermark needs the full waveform, so generation cannot be streamed to the
+    # file; the finished waveform is copied to host once and written in one call
+    audio = audio.clamp(-1.0, 1.0).float().view(-1)
+    audio = copy_to_pinned(audio) if audio.is_cuda else audio.cpu()
+    sf.write(output, audio.numpy(), sample_rate, subtype='PCM_16')
+    
+    # Verify the saved file
+    try:
+        file_size = os.path.getsize(output)
+    except OSError:
+        log.error("Failed to save audio file, %s does not exist!", output)
+        return
+    log.debug("Audio saved to %s (%s bytes)", output, file_size)
+    if file_size == 0:
+        log.warning("Saved audio file is empty (0 bytes)!")
+    else:
+        log.debug("File size looks good: %s bytes", file_size)
+
+def generate_to_files(generator, items, context=None, max_audio_length=10000, temperature=0.9, topk=50):
+    """Generate speech for each ``{"text", "speaker", "output"}`` item in one batched decode.
+
+    All items share ``context`` and the sampling parameters.
+    """
+    if not items:
+        raise ValueError("No utterances to generate")
+    for i, item in enumerate(items):
+        if not item.get('text') or not item.get('output'):
+            raise ValueError(f"Item {i} needs both 'text' and 'output'")
+    
+    for item in items:
+        prepare_output_dir(item['output'])
+    
+    # Generate speech
+    log.debug("Generating speech for %s utterance(s)...", len(items))
     try:
-        print(f"=== CSM Speech Generator Debug ===")
-        print(f"Python version: {sys.version}")
-        print(f"PyTorch version: {torch.__version__}")
-        print(f"Working directory: {os.getcwd()}")
+        audios = generator.generate_batch(
+            texts=[item['text'] for item in items],
+            speakers=[item.get('speaker', 0) for item in items],
+            context=context or [],
+            max_audio_length_ms=max_audio_length,
+            temperature=temperature,
+            topk=topk,
+            precomputed_context=encode_context(generator, context or []),
+        )
+    except Exception as e:
+        log.exception("Error during audio generation: %s", e)
+        raise
+    
+    for item, audio in zip(items, audios):
+        save_audio(audio, item['output'], generator.sample_rate)
+    
+    return [item['output'] for item in items]
+
+def serve(generator):
+    """Serve generation requests as JSON lines on stdin until EOF.
+
+    Each request carries the same fields as the CLI arguments (``text``, ``output``,
+    ``speaker``, ``context``, ``max_audio_length``, ``temperature``, ``topk``) plus an
+    optional ``id`` that is echoed back. Instead of ``text``/``output``/``speaker`` a
+    request may carry ``items``, a list of ``{"text", "speaker", "output"}`` objects that
+    are generated as one batch. One JSON response line is written per request.
+    Logging and any stray prints go to stderr so stdout only carries responses.
+    """
+    responses = sys.stdout
+    sys.stdout = sys.stderr
+    log.info("Generation server ready")
+    
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        
+        request_id = None
+        try:
+            req = json.loads(line)
+            request_id = req.get('id')
+            context = load_context(req.get('context'), generator)
+            items = req.get('items') or [
+                {"text": req['text'], "speaker": req.get('speaker', 0), "output": req['output']}
+            ]
+            paths = generate_to_files(
+                generator,
+                items,
+                context=context,
+                max_audio_length=req.get('max_audio_length', 10000),
+                temperature=req.get('temperature', 0.9),
+                topk=req.get('topk', 50),
+            )
+            response = {"id": request_id, "ok": True, "path": paths[0], "paths": paths}
+        except Exception as e:
+            log.exception("Request failed: %s", e)
+            response = {"id": request_id, "ok": False, "error": str(e)}
+        
+        responses.write(json.dumps(response) + "\n")
+        responses.flush()
         
+        # Hand per-request activations back to the driver so the transcription
+        # worker sharing the GPU can use them while this one is idle
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+def main():
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
         parser = argparse.ArgumentParser(description='Generate speech using CSM 1B')
-        parser.add_argument('--text', type=str, required=True, help='Text to convert to speech')
+        text_group = parser.add_mutually_exclusive_group()
+        text_group.add_argument('--text', type=str, help='Text to convert to speech')
+        text_group.add_argument('--texts_json', type=str,
+                                help='Path to a JSON list of {"text", "speaker", "output"} objects to generate as one batch')
         parser.add_argument('--speaker', type=int, default=0, help='Speaker ID (0 or 1)')
-        parser.add_argument('--output', type=str, required=True, help='Output audio file path')
+        parser.add_argument('--output', type=str, help='Output audio file path')
         parser.add_argument('--context', type=str, help='Path to context JSON file')
         parser.add_argument('--max_audio_length', type=int, default=10000, 
                            help='Maximum audio length in ms (not a target length, the model will output shorter audio when appropriate)')
@@ -27,176 +491,65 @@ def main():
         parser.add_argument('--model_path', type=str, help='Path to model checkpoint')
         parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu', 
                             help='Device to run model on')
+        parser.add_argument('--compile', action='store_true',
+                            help='Compile the model with torch.compile (CUDA only, amortised best in long-lived processes)')
+        parser.add_argument('--cpu_threads', type=cpu_threads_arg, default=os.environ.get('CSM_CPU_THREADS') or None,
+                            help='Number of threads for CPU inference (defaults to $CSM_CPU_THREADS, else PyTorch default)')
+        parser.add_argument('--verbose', action='store_true',
+                            help='Log debug diagnostics (otherwise the level comes from $CSM_LOG, default WARNING)')
+        parser.add_argument('--server', action='store_true',
+                            help='Keep the model loaded and serve JSON requests from stdin, one per line')
         
         args = parser.parse_args()
+        if not args.server and not args.texts_json and (not args.text or not args.output):
+            parser.error("--text and --output (or --texts_json) are required unless --server is used")
+        if args.texts_json and args.output:
+            parser.error("--output cannot be used with --texts_json; give each item its own output")
         
-        print(f"Received arguments:")
-        print(f"  Text: {args.text}")
-        print(f"  Speaker: {args.speaker}")
-        print(f"  Output path: {args.output}")
-        print(f"  Context file: {args.context if args.context else 'None'}")
-        print(f"  Device: {args.device}")
+        log.setLevel(logging.DEBUG if args.verbose else os.environ.get("CSM_LOG", "WARNING").upper())
+        log.debug("=== CSM Speech Generator Debug ===")
+        log.debug("Python version: %s", sys.version)
+        log.debug("PyTorch version: %s", torch.__version__)
+        log.debug("Working directory: %s", os.getcwd())
         
-        # Check if output directory exists
-        output_dir = os.path.dirname(args.output)
-        print(f"Output directory: {output_dir}")
+        # Nothing here trains; skip autograd bookkeeping for model loading and context
+        # preparation too (Generator.generate itself runs under torch.inference_mode)
+        torch.set_grad_enabled(False)
         
-        if output_dir and not os.path.exists(output_dir):
-            print(f"Creating output directory: {output_dir}")
-            os.makedirs(output_dir, exist_ok=True)
+        if args.device == "cpu":
+            configure_cpu_threads(args.cpu_threads)
         
-        # Check if output directory is writable
-        if output_dir:
-            test_file = os.path.join(output_dir, ".write_test")
-            try:
-                with open(test_file, 'w') as f:
-                    f.write("test")
-                os.remove(test_file)
-                print(f"Output directory is writable")
-            except Exception as e:
-                print(f"WARNING: Output directory is not writable: {e}")
+        log.debug("Received arguments:")
+        log.debug("  Text: %s", args.text)
+        log.debug("  Speaker: %s", args.speaker)
+        log.debug("  Output path: %s", args.output)
+        log.debug("  Context file: %s", args.context if args.context else 'None')
+        log.debug("  Device: %s", args.device)
         
-        # Load model
-        print(f"Loading model...")
-        if args.model_path and os.path.exists(args.model_path):
-            # Use explicit model path if provided and exists
-            model_path = args.model_path
-            print(f"Using provided model path: {model_path}")
-        else:
-            # Check for local model in common locations
-            local_model_paths = [
-                "ckpt.pt",  # Current directory
-                os.path.join(os.path.dirname(os.getcwd()), "ckpt.pt"),  # Parent directory
-                os.path.expanduser("~/.cache/huggingface/hub/models--sesame--csm-1b/snapshots/d8622e3e950f9875853f8345deb2519a02957bcb/ckpt.pt")
-            ]
-            
-            for path in local_model_paths:
-                if os.path.exists(path):
-                    model_path = path
-                    print(f"Found local model at: {model_path}")
-                    break
-            else:
-                # Download model if not found locally
-                print(f"Downloading model from Hugging Face...")
-                try:
-                    model_path = hf_hub_download(repo_id="sesame/csm-1b", filename="ckpt.pt")
-                    print(f"Model downloaded to: {model_path}")
-                except Exception as e:
-                    print(f"Error downloading model: {e}")
-                    raise
+        generator = init_generator(args.model_path, args.device, compile=args.compile)
         
-        # Verify model exists
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Model file not found at {model_path}")
-            
-        # Initialize generator
-        print(f"Initializing generator on {args.device}...")
-        try:
-            # Explicitly pass the model path
-            generator = load_csm_1b(ckpt_path=model_path, device=args.device)
-            print(f"Generator initialized")
-        except Exception as e:
-            print(f"Error initializing generator: {e}")
-            print(traceback.format_exc())
-            raise
+        if args.server:
+            serve(generator)
+            return
         
-        # Load context if provided
-        context = []
-        if args.context and os.path.exists(args.context):
-            print(f"Loading context from {args.context}")
-            try:
-                with open(args.context, 'r') as f:
-                    context_data = json.load(f)
-                
-                print(f"Context data loaded, {len(context_data)} segments found")
-                    
-                for i, segment in enumerate(context_data):
-                    try:
-                        # If audio path is provided, load audio from file
-                        if 'audioPath' in segment and os.path.exists(segment['audioPath']):
-                            print(f"Loading audio from path for segment {i}: {segment['audioPath']}")
-                            audio_tensor, sample_rate = torchaudio.load(segment['audioPath'])
-                            audio_tensor = torchaudio.functional.resample(
-                                audio_tensor.squeeze(0), 
-                                orig_freq=sample_rate, 
-                                new_freq=generator.sample_rate
-                            )
-                            print(f"Audio loaded and resampled from {sample_rate} to {generator.sample_rate}")
-                        elif 'audio' in segment and segment['audio']:
-                            # If audio data is provided directly (as array)
-                            print(f"Using provided audio data for segment {i}")
-                            audio_tensor = torch.tensor(segment['audio'], dtype=torch.float32)
-                        else:
-                            # Skip segments without audio
-                            print(f"Skipping segment {i} - no audio data")
-                            continue
-                        
-                        context.append(
-                            Segment(
-                                text=segment['text'],
-                                speaker=segment['speaker'],
-                                audio=audio_tensor
-                            )
-                        )
-                        print(f"Added segment {i} to context")
-                    except Exception as e:
-                        print(f"Error processing context segment {i}: {e}")
-                        print(traceback.format_exc())
-                
-                print(f"Final context contains {len(context)} segments")
-            except Exception as e:
-                print(f"Error loading context: {e}")
-                print(traceback.format_exc())
-                context = []
+        if args.texts_json:
+            with open(args.texts_json, 'r') as f:
+                items = [{"speaker": args.speaker, **item} for item in json.load(f)]
         else:
-            print(f"No context provided or context file not found")
-        
-        # Generate speech
-        print(f"Generating speech...")
-        try:
-            audio = generator.generate(
-                text=args.text,
-                speaker=args.speaker,
-                context=context,
-                max_audio_length_ms=args.max_audio_length,
-                temperature=args.temperature,
-                topk=args.topk,
-            )
-        except Exception as e:
-            print(f"Error during audio generation: {e}")
-            print(traceback.format_exc())
-            raise
+            items = [{"text": args.text, "speaker": args.speaker, "output": args.output}]
         
-        # Check the generated audio
-        print(f"Audio generated: shape={audio.shape}, dtype={audio.dtype}")
-        if audio.numel() == 0:
-            print(f"WARNING: Generated audio is empty!")
-        
-        # Print audio stats to verify it's not empty
-        if audio.numel() > 0:
-            print(f"Audio min value: {audio.min().item()}")
-            print(f"Audio max value: {audio.max().item()}")
-            print(f"Audio mean value: {audio.mean().item()}")
-        
-        # Save audio
-        print(f"Saving audio to {args.output}...")
-        os.makedirs(os.path.dirname(args.output), exist_ok=True)
-        torchaudio.save(args.output, audio.unsqueeze(0).cpu(), generator.sample_rate)
-        
-        # Verify the saved file
-        if os.path.exists(args.output):
-            file_size = os.path.getsize(args.output)
-            print(f"Audio saved to {args.output} ({file_size} bytes)")
-            if file_size == 0:
-                print(f"WARNING: Saved audio file is empty (0 bytes)!")
-            else:
-                print(f"File size looks good: {file_size} bytes")
-        else:
-            print(f"ERROR: Failed to save audio file, {args.output} does not exist!")
+        context = load_context(args.context, generator)
+        generate_to_files(
+            generator,
+            items,
+            context=context,
+            max_audio_length=args.max_audio_length,
+            temperature=args.temperature,
+            topk=args.topk,
+        )
 
     except Exception as e:
-        print(f"ERROR: Unhandled exception: {e}")
-        print(traceback.format_exc())
+        log.exception("Unhandled exception: %s", e)
         raise
 
 if __name__ == "__main__":
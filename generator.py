@@ -1,5 +1,6 @@
+import logging
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import torch
 import torchaudio
@@ -11,6 +12,8 @@ from transformers import AutoTokenizer
 from watermarking import CSM_1B_GH_WATERMARK, load_watermarker, watermark
 import os
 
+log = logging.getLogger("csm.generator")
+
 
 @dataclass
 class Segment:
@@ -44,6 +47,7 @@ class Generator:
     ):
         self._model = model
         self._model.setup_caches(1)
+        self._batch_size = 1
 
         self._text_tokenizer = load_llama3_tokenizer()
 
@@ -105,6 +109,23 @@ class Generator:
         return torch.cat([text_tokens, audio_tokens], dim=0), torch.cat([text_masks, audio_masks], dim=0)
 
     @torch.inference_mode()
+    def tokenize_context(self, context: List[Segment]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Tokenize a context once so it can be reused across generate calls.
+
+        Returns:
+            (seq_len, 33), (seq_len, 33)
+        """
+        tokens, tokens_mask = [], []
+        for segment in context:
+            segment_tokens, segment_tokens_mask = self._tokenize_segment(segment)
+            tokens.append(segment_tokens)
+            tokens_mask.append(segment_tokens_mask)
+
+        if not tokens:
+            return torch.zeros(0, 33).long().to(self.device), torch.zeros(0, 33).bool().to(self.device)
+        return torch.cat(tokens, dim=0), torch.cat(tokens_mask, dim=0)
+
     def generate(
         self,
         text: str,
@@ -113,68 +134,135 @@ class Generator:
         max_audio_length_ms: float = 90_000,
         temperature: float = 0.9,
         topk: int = 50,
+        precomputed_context: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
     ) -> torch.Tensor:
+        return self.generate_batch(
+            [text], [speaker], context, max_audio_length_ms, temperature, topk, precomputed_context
+        )[0]
+
+    @torch.inference_mode()
+    def generate_batch(
+        self,
+        texts: List[str],
+        speakers: List[int],
+        context: List[Segment],
+        max_audio_length_ms: float = 90_000,
+        temperature: float = 0.9,
+        topk: int = 50,
+        precomputed_context: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    ) -> List[torch.Tensor]:
+        """
+        Generate one utterance per (text, speaker) pair in a single batched decode,
+        all sharing the same context. If precomputed_context (the output of
+        tokenize_context) is given, it is used instead of tokenizing context.
+        """
+        batch_size = len(texts)
+        if batch_size == 0:
+            raise ValueError("At least one text is required")
+        if len(speakers) != batch_size:
+            raise ValueError(f"Got {batch_size} texts but {len(speakers)} speakers")
+        if batch_size != self._batch_size:
+            self._model.setup_caches(batch_size)
+            self._batch_size = batch_size
         self._model.reset_caches()
 
         max_audio_frames = int(max_audio_length_ms / 80)
-        tokens, tokens_mask = [], []
-        for segment in context:
-            segment_tokens, segment_tokens_mask = self._tokenize_segment(segment)
-            tokens.append(segment_tokens)
-            tokens_mask.append(segment_tokens_mask)
-
-        gen_segment_tokens, gen_segment_tokens_mask = self._tokenize_text_segment(text, speaker)
-        tokens.append(gen_segment_tokens)
-        tokens_mask.append(gen_segment_tokens_mask)
-
-        prompt_tokens = torch.cat(tokens, dim=0).long().to(self.device)
-        prompt_tokens_mask = torch.cat(tokens_mask, dim=0).bool().to(self.device)
+        if precomputed_context is None:
+            precomputed_context = self.tokenize_context(context)
+        context_tokens, context_tokens_mask = precomputed_context
+
+        prompts = []
+        for text, speaker in zip(texts, speakers):
+            gen_segment_tokens, gen_segment_tokens_mask = self._tokenize_text_segment(text, speaker)
+            prompts.append(
+                (
+                    torch.cat([context_tokens, gen_segment_tokens], dim=0),
+                    torch.cat([context_tokens_mask, gen_segment_tokens_mask], dim=0),
+                )
+            )
+
+        # Left-pad the prompts to a common length so every row continues from the same position
+        prompt_len = max(tokens.size(0) for tokens, _ in prompts)
+        prompt_tokens = torch.zeros(batch_size, prompt_len, 33).long().to(self.device)
+        prompt_tokens_mask = torch.zeros(batch_size, prompt_len, 33).bool().to(self.device)
+        padding_mask = torch.ones(batch_size, 2048).bool().to(self.device)
+        padded = False
+        for i, (tokens, tokens_mask) in enumerate(prompts):
+            pad = prompt_len - tokens.size(0)
+            prompt_tokens[i, pad:] = tokens
+            prompt_tokens_mask[i, pad:] = tokens_mask
+            padding_mask[i, :pad] = False
+            padded = padded or pad > 0
 
         samples = []
-        curr_tokens = prompt_tokens.unsqueeze(0)
-        curr_tokens_mask = prompt_tokens_mask.unsqueeze(0)
-        curr_pos = torch.arange(0, prompt_tokens.size(0)).unsqueeze(0).long().to(self.device)
+        curr_tokens = prompt_tokens
+        curr_tokens_mask = prompt_tokens_mask
+        curr_pos = torch.arange(0, prompt_len).unsqueeze(0).repeat(batch_size, 1).long().to(self.device)
 
         max_seq_len = 2048 - max_audio_frames
         if curr_tokens.size(1) >= max_seq_len:
             raise ValueError(f"Inputs too long, must be below max_seq_len - max_audio_frames: {max_seq_len}")
 
-        # Generate frames until we hit EOS or max length
+        # Generate frames until every row has hit EOS or max length
+        num_frames = [None] * batch_size
         for _ in range(max_audio_frames):
-            sample = self._model.generate_frame(curr_tokens, curr_tokens_mask, curr_pos, temperature, topk)
+            sample = self._model.generate_frame(
+                curr_tokens, curr_tokens_mask, curr_pos, temperature, topk, padding_mask if padded else None
+            )
             # Check if we've reached EOS (all zeros)
-            if torch.all(sample == 0):
-                print(f"Reached EOS token after {len(samples)} frames")
+            for i, eos in enumerate(torch.all(sample == 0, dim=1).tolist()):
+                if eos and num_frames[i] is None:
+                    log.debug("Reached EOS token after %s frames", len(samples))
+                    num_frames[i] = len(samples)
+            if all(n is not None for n in num_frames):
                 break  # eos
 
             samples.append(sample)
 
-            curr_tokens = torch.cat([sample, torch.zeros(1, 1).long().to(self.device)], dim=1).unsqueeze(1)
+            curr_tokens = torch.cat([sample, torch.zeros(batch_size, 1).long().to(self.device)], dim=1).unsqueeze(1)
             curr_tokens_mask = torch.cat(
-                [torch.ones_like(sample).bool(), torch.zeros(1, 1).bool().to(self.device)], dim=1
+                [torch.ones_like(sample).bool(), torch.zeros(batch_size, 1).bool().to(self.device)], dim=1
             ).unsqueeze(1)
             curr_pos = curr_pos[:, -1:] + 1
 
-        # If we have no samples (unlikely), return empty tensor
-        if not samples:
-            print("Warning: No audio frames were generated")
-            return torch.zeros(1, dtype=torch.float32, device=self.device)
+        audios = []
+        for i in range(batch_size):
+            # Frames past a row's EOS are ignored
+            row_samples = samples[: num_frames[i] if num_frames[i] is not None else len(samples)]
+
+            # If we have no samples (unlikely), return empty tensor
+            if not row_samples:
+                log.warning("No audio frames were generated")
+                audios.append(torch.zeros(1, dtype=torch.float32, device=self.device))
+                continue
+
+            frames = torch.stack(row_samples)[:, i : i + 1]
+            audio = self._audio_tokenizer.decode(frames.permute(1, 2, 0)).squeeze(0).squeeze(0)
+
+            # This applies an imperceptible watermark to identify audio as AI-generated.
+            # Watermarking ensures transparency, dissuades misuse, and enables traceability.
+            # Please be a responsible AI citizen and keep the watermarking in place.
+            # If using CSM 1B in another application, use your own private key and keep it secret.
+            audio, wm_sample_rate = watermark(self._watermarker, audio, self.sample_rate, CSM_1B_GH_WATERMARK)
+            audio = torchaudio.functional.resample(audio, orig_freq=wm_sample_rate, new_freq=self.sample_rate)
+
+            log.debug(
+                "Generated audio of length %.2fs from %s frames", len(audio) / self.sample_rate, len(row_samples)
+            )
+            audios.append(audio)
 
-        audio = self._audio_tokenizer.decode(torch.stack(samples).permute(1, 2, 0)).squeeze(0).squeeze(0)
+        return audios
 
-        # This applies an imperceptible watermark to identify audio as AI-generated.
-        # Watermarking ensures transparency, dissuades misuse, and enables traceability.
-        # Please be a responsible AI citizen and keep the watermarking in place.
-        # If using CSM 1B in another application, use your own private key and keep it secret.
-        audio, wm_sample_rate = watermark(self._watermarker, audio, self.sample_rate, CSM_1B_GH_WATERMARK)
-        audio = torchaudio.functional.resample(audio, orig_freq=wm_sample_rate, new_freq=self.sample_rate)
 
-        print(f"Generated audio of length {len(audio) / self.sample_rate:.2f}s from {len(samples)} frames")
-        return audio
+def _load_state_dict(ckpt_path: str) -> dict:
+    # Memory-map the checkpoint so tensors are paged in from disk as load_state_dict
+    # copies them onto the model's device, instead of first materialising a full copy
+    # in host memory. weights_only avoids unpickling arbitrary objects.
+    return torch.load(ckpt_path, map_location="cpu", mmap=True, weights_only=True)
 
 
 def load_csm_1b(ckpt_path: str = "ckpt.pt", device: str = "cuda") -> Generator:
-    print(f"Loading model from {ckpt_path} on device {device}")
+    log.debug("Loading model from %s on device %s", ckpt_path, device)
     
     model_args = ModelArgs(
         backbone_flavor="llama-1B",
@@ -186,27 +274,27 @@ def load_csm_1b(ckpt_path: str = "ckpt.pt", device: str = "cuda") -> Generator:
     
     try:
         model = Model(model_args).to(device=device, dtype=torch.bfloat16)
-        print("Model initialized successfully")
+        log.debug("Model initialized successfully")
         
-        print(f"Loading state dictionary from {ckpt_path}")
+        log.debug("Loading state dictionary from %s", ckpt_path)
         if not os.path.exists(ckpt_path):
             raise FileNotFoundError(f"Checkpoint file {ckpt_path} does not exist")
             
-        state_dict = torch.load(ckpt_path, map_location=device)
-        print(f"State dictionary loaded, keys: {len(state_dict.keys())}")
+        state_dict = _load_state_dict(ckpt_path)
+        log.debug("State dictionary loaded, keys: %s", len(state_dict.keys()))
         
         model.load_state_dict(state_dict)
-        print("State dictionary loaded into model")
+        log.debug("State dictionary loaded into model")
         
         generator = Generator(model)
         return generator
     except AttributeError as e:
         # Handle the specific error related to 'cadam32bit_grad_fp32'
         if "'NoneType' object has no attribute 'cadam32bit_grad_fp32'" in str(e):
-            print("Warning: Encountered known issue with cadam32bit_grad_fp32, but continuing...")
+            log.warning("Encountered known issue with cadam32bit_grad_fp32, but continuing...")
             # Continue with model loading despite the error
             model = Model(model_args).to(device=device, dtype=torch.bfloat16)
-            state_dict = torch.load(ckpt_path, map_location=device)
+            state_dict = _load_state_dict(ckpt_path)
             
             # Filter out problematic optimizer keys if present
             filtered_state_dict = {k: v for k, v in state_dict.items() if not k.startswith('optimizer')}
@@ -218,7 +306,5 @@ def load_csm_1b(ckpt_path: str = "ckpt.pt", device: str = "cuda") -> Generator:
             # For other attribute errors, re-raise
             raise
     except Exception as e:
-        print(f"Error loading model: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error loading model: %s", e)
         raise
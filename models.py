@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 import torch
 import torch.nn as nn
@@ -115,12 +116,20 @@ class Model(nn.Module):
         dtype = next(self.parameters()).dtype
         device = next(self.parameters()).device
 
+        # torchtune skips layers whose caches already exist, so drop them first to
+        # allow re-allocating the caches for a different batch size.
+        for layer in [*self.backbone.layers, *self.decoder.layers]:
+            layer.attn.kv_cache = None
+
         with device:
             self.backbone.setup_caches(max_batch_size, dtype)
             self.decoder.setup_caches(max_batch_size, dtype, decoder_max_seq_len=self.args.audio_num_codebooks)
 
         self.register_buffer("backbone_causal_mask", _create_causal_mask(self.backbone.max_seq_len, device))
         self.register_buffer("decoder_causal_mask", _create_causal_mask(self.args.audio_num_codebooks, device))
+        self.register_buffer(
+            "backbone_identity_mask", torch.eye(self.backbone.max_seq_len, dtype=torch.bool, device=device)
+        )
 
     def generate_frame(
         self,
@@ -129,6 +138,7 @@ class Model(nn.Module):
         input_pos: torch.Tensor,
         temperature: float,
         topk: int,
+        padding_mask: Optional[torch.Tensor] = None,
     ) -> torch.Tensor:
         """
         Args:
@@ -136,6 +146,7 @@ class Model(nn.Module):
             tokens_mask: (batch_size, seq_len, audio_num_codebooks+1)
             input_pos: (batch_size, seq_len) positions for each token
             mask: (batch_size, seq_len, max_seq_len
+            padding_mask: (batch_size, max_seq_len) False at left-padding positions
 
         Returns:
             (batch_size, audio_num_codebooks) sampled tokens
@@ -145,6 +156,11 @@ class Model(nn.Module):
 
         assert self.backbone.caches_are_enabled(), "backbone caches are not enabled"
         curr_backbone_mask = _index_causal_mask(self.backbone_causal_mask, input_pos)
+        if padding_mask is not None:
+            # Padding positions are hidden from every query; padding queries still see
+            # themselves so their attention rows never become all -inf (NaN).
+            curr_backbone_mask = curr_backbone_mask & padding_mask.unsqueeze(1)
+            curr_backbone_mask = curr_backbone_mask | _index_causal_mask(self.backbone_identity_mask, input_pos)
         embeds = self._embed_tokens(tokens)
         masked_embeds = embeds * tokens_mask.unsqueeze(-1)
         h = masked_embeds.sum(dim=2)
@@ -60,22 +60,20 @@ if "%VIRTUAL_ENV%"=="" (
     )
 )
 
-REM Check for whisper model and download if not present
-echo Checking for Whisper package...
-python -c "import importlib.util; print(1 if importlib.util.find_spec('whisper') else 0)" > temp.txt
+REM Check for faster-whisper and download the model if not present
+echo Checking for faster-whisper package...
+python -c "import importlib.util; print(1 if importlib.util.find_spec('faster_whisper') else 0)" > temp.txt
 set /p WHISPER_INSTALLED=<temp.txt
 del temp.txt
 
 if "!WHISPER_INSTALLED!"=="0" (
-    echo Installing Whisper package...
-    uv pip install openai-whisper
+    echo Installing faster-whisper package...
+    uv pip install faster-whisper
 )
 
-REM Check if the 'base' model is already downloaded
-if not exist "%USERPROFILE%\.cache\whisper\base.pt" (
-    echo Downloading Whisper base model (this may take a minute^)...
-    python -c "import whisper; whisper.load_model('base')" || echo Failed to download Whisper model. Will attempt on first use.
-)
+REM Make sure the 'base' model is downloaded (no-op if it is already cached)
+echo Checking Whisper base model (first download may take a minute^)...
+python -c "from faster_whisper import WhisperModel; WhisperModel('base', device='cpu', compute_type='int8')" || echo Failed to download Whisper model. Will attempt on first use.
 
 REM Change to the UI directory
 cd csm-ui
@@ -71,18 +71,15 @@ if [[ -z "$VIRTUAL_ENV" ]]; then
   fi
 fi
 
-# Check for whisper model and download if not present
-if ! check_package whisper; then
-  echo "Installing Whisper package..."
-  uv pip install openai-whisper
+# Check for faster-whisper and download the model if not present
+if ! check_package faster_whisper; then
+  echo "Installing faster-whisper package..."
+  uv pip install faster-whisper
 fi
 
-# Check if the 'base' model is already downloaded
-if [[ ! -d "$HOME/.cache/whisper/base.pt" ]]; then
-  echo "Downloading Whisper base model (this may take a minute)..."
-  # Trigger a download by importing whisper and loading the model
-  python -c "import whisper; whisper.load_model('base')" || echo "Failed to download Whisper model. Will attempt on first use."
-fi
+# Make sure the 'base' model is downloaded (no-op if it is already cached)
+echo "Checking Whisper base model (first download may take a minute)..."
+python -c "from faster_whisper import WhisperModel; WhisperModel('base', device='cpu', compute_type='int8')" || echo "Failed to download Whisper model. Will attempt on first use."
 
 # Start the Next.js server in the background
 cd csm-ui
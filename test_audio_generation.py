@@ -2,13 +2,23 @@
 """
 Test script for audio generation to identify production mode issues.
 """
+import logging
 import os
 import sys
+
+# Must be set before torch initialises CUDA (see generate_speech.py)
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+
 import torch
-import torchaudio
 from generator import load_csm_1b, Segment
+from generate_speech import configure_cpu_threads, cpu_threads_arg, save_audio
 
 def main():
+    torch.set_grad_enabled(False)
+    # Show the generator's and save_audio's diagnostics alongside this script's output
+    logging.basicConfig(format="%(levelname)s %(name)s: %(message)s")
+    logging.getLogger("csm").setLevel(logging.DEBUG)
+    
     print("=== Audio Generation Test ===")
     print(f"Python version: {sys.version}")
     print(f"PyTorch version: {torch.__version__}")
@@ -21,6 +31,14 @@ def main():
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"Using device: {device}")
     
+    if device == "cpu":
+        cpu_threads = os.environ.get("CSM_CPU_THREADS")
+        configure_cpu_threads(cpu_threads_arg(cpu_threads) if cpu_threads else None)
+    
+    # Model weights are bfloat16 already; allow TF32 for the remaining FP32 paths
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    
     # Get model path - use local model if available, otherwise download
     model_path = None
     if os.path.exists("ckpt.pt"):
@@ -40,39 +58,20 @@ def main():
         
         # Generate audio
         print(f"Generating audio for text: '{test_text}'")
-        audio = generator.generate(
-            text=test_text,
-            speaker=speaker_id,
-            context=[],
-            max_audio_length_ms=10000,
-            temperature=0.9,
-            topk=50,
-        )
-        
-        # Print audio stats
-        print(f"Audio generated: shape={audio.shape}, dtype={audio.dtype}")
-        if audio.numel() == 0:
-            print(f"WARNING: Generated audio is empty!")
-        else:
-            print(f"Audio min value: {audio.min().item()}")
-            print(f"Audio max value: {audio.max().item()}")
-            print(f"Audio mean value: {audio.mean().item()}")
+        with torch.inference_mode():
+            audio = generator.generate(
+                text=test_text,
+                speaker=speaker_id,
+                context=[],
+                max_audio_length_ms=10000,
+                temperature=0.9,
+                topk=50,
+            )
         
-        # Save the audio
+        # Check, save and verify the audio the same way generate_speech.py does
+        # (pinned D2H copy, PCM_16)
         output_file = "test_output.wav"
-        print(f"Saving audio to {output_file}")
-        torchaudio.save(output_file, audio.unsqueeze(0).cpu(), generator.sample_rate)
-        
-        # Verify the saved file
-        if os.path.exists(output_file):
-            file_size = os.path.getsize(output_file)
-            print(f"Audio saved successfully ({file_size} bytes)")
-            if file_size == 0:
-                print(f"WARNING: Saved audio file is empty (0 bytes)!")
-            else:
-                print(f"File size looks good: {file_size} bytes")
-        else:
-            print(f"ERROR: Failed to save audio file!")
+        save_audio(audio, output_file, generator.sample_rate)
             
     except Exception as e:
         print(f"ERROR: {type(e).__name__}: {e}")
@@ -2,44 +2,85 @@ import argparse
 import json
 import os
 import sys
-import whisper
+from faster_whisper import WhisperModel
 from huggingface_hub import hf_hub_download
 import torch
 
+def load_model(model_name):
+    # Load the Whisper model (will download on first run)
+    print(f"Loading Whisper {model_name} model...", file=sys.stderr)
+    # CTranslate2 runs int8 weights with a fused decoder; keep activations in fp16 on GPU
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    compute_type = "int8_float16" if device == "cuda" else "int8"
+    return WhisperModel(model_name, device=device, compute_type=compute_type)
+
+def transcribe(model, audio_path):
+    # Check if audio file exists
+    if not os.path.exists(audio_path):
+        return {"error": f"Audio file not found: {audio_path}"}
+
+    # Transcribe the audio
+    print(f"Transcribing audio...", file=sys.stderr)
+    # Greedy decoding; the VAD filter skips silent stretches before they reach the decoder
+    segments, info = model.transcribe(audio_path, beam_size=1, vad_filter=True)
+    # Segments are produced lazily, decoding happens while iterating
+    segments = [{"start": s.start, "end": s.end, "text": s.text} for s in segments]
+
+    # Return the result as JSON
+    return {
+        "text": "".join(s["text"] for s in segments).strip(),
+        "segments": segments,
+        "language": info.language
+    }
+
+def serve(model):
+    # Read {"id": ..., "audio": ...} requests from stdin, one JSON object per line,
+    # and answer each with one JSON line carrying the same id
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        request_id = None
+        try:
+            req = json.loads(line)
+            request_id = req.get('id')
+            output = transcribe(model, req['audio'])
+        except Exception as e:
+            output = {"error": str(e)}
+
+        output["id"] = request_id
+        print(json.dumps(output), flush=True)
+
 def main():
-    parser = argparse.ArgumentParser(description='Transcribe audio using Whisper')
-    parser.add_argument('--audio', type=str, required=True, help='Path to audio file')
+    parser = argparse.ArgumentParser(description='Transcribe audio using Whisper (faster-whisper)')
+    parser.add_argument('--audio', type=str, help='Path to audio file')
     parser.add_argument('--model', type=str, default='base', help='Whisper model to use (tiny, base, small, medium, large)')
-    
+    parser.add_argument('--server', action='store_true',
+                        help='Keep the model loaded and serve JSON requests from stdin, one per line')
+
     args = parser.parse_args()
-    
+    if not args.server and not args.audio:
+        parser.error("--audio is required unless --server is used")
+
     # Check if audio file exists
-    if not os.path.exists(args.audio):
+    if args.audio and not os.path.exists(args.audio):
         print(json.dumps({"error": f"Audio file not found: {args.audio}"}))
         sys.exit(1)
-    
+
     try:
-        # Load the Whisper model (will download on first run)
-        print(f"Loading Whisper {args.model} model...", file=sys.stderr)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        model = whisper.load_model(args.model, device=device)
-        
-        # Transcribe the audio
-        print(f"Transcribing audio...", file=sys.stderr)
-        result = model.transcribe(args.audio)
-        
-        # Return the result as JSON
-        output = {
-            "text": result["text"].strip(),
-            "segments": result["segments"],
-            "language": result["language"]
-        }
-        
+        model = load_model(args.model)
+
+        if args.server:
+            serve(model)
+            return
+
+        output = transcribe(model, args.audio)
         print(json.dumps(output))
-        
+
     except Exception as e:
         print(json.dumps({"error": str(e)}))
         sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()